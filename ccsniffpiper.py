@@ -39,12 +39,16 @@
 """
 
 import argparse
+import array
 import binascii
 import errno
 import io
 import logging.handlers
+import mmap
+import multiprocessing
 import os
 import select
+import signal
 import stat
 import struct
 import sys
@@ -64,11 +68,19 @@ defaults = {
     'log_level': 'INFO',
     'log_file': 'ccsniffpiper.log',
     'channel': 37,
+    'ring_file': 'ccsniffpiper-trigger.pcap',
+    'ring_frames': 10000,
+    'pre_trigger': 10.0,
+    'post_trigger': 10.0,
+    'chunk_size': 16,
 }
 
 logger = logging.getLogger(__name__)
 stats = {}
 
+# The sniffer timestamp is a 32-bit count of 1/32 us, it wraps every ~134 s
+TIMESTAMP_WRAP_USEC = 2**32 / 32.0
+
 
 class Frame(object):
     PCAP_FRAME_HDR_FMT = '<LLLL'
@@ -97,6 +109,9 @@ class Frame(object):
     def get_hex(self):
         return self.hex
 
+    def get_macPDU(self):
+        return self.__macPDUByteArray
+
     def get_timestamp(self):
         return self.timestampUsec
 
@@ -278,6 +293,254 @@ class HexdumpHandler(object):
             logger.warning(f'The error was: {e.args}')
 
 
+class RingBufferHandler(object):
+    """ Keeps the most recent frames in a fixed-size, preallocated ring and
+        dumps them to pcap when a trigger fires.
+
+        A dump contains the frames received up to pre_trigger seconds before
+        the trigger and up to post_trigger seconds after it. Triggers are a
+        byte pattern found in a frame's MAC PDU or an explicit call to
+        triggerDump() (stdin command, signal).
+
+        Memory is bounded to two rings of ring_frames slots each: the live
+        ring and the snapshot handed to the writer thread. The capture thread
+        only copies the live ring into the snapshot; the file is written by
+        the writer thread. A trigger completing while the previous dump is
+        still being written is dropped and counted.
+
+        Once triggered, a share of the ring proportional to post_trigger is
+        kept for post-trigger frames, so a ring shorter than the windows
+        truncates both rather than losing the post-trigger frames. After a
+        dump, triggers are ignored (and counted) until pre_trigger seconds
+        have passed, so a periodic match does not dump continuously. Explicit
+        triggers are never held off.
+
+        Dumps are numbered after the highest existing dump file and never
+        overwrite one. close() flushes an armed trigger and the writer.
+    """
+    # pcap record header + largest frame the sniffer reports
+    SLOT_SIZE = 16 + 0xFF
+
+    def __init__(self, filename, ring_frames, pre_trigger, post_trigger,
+                 pattern=None):
+        self.filename = filename
+        self.capacity = ring_frames
+        self.pre_trigger = pre_trigger * 1000000
+        self.post_trigger = post_trigger * 1000000
+        self.pattern = pattern
+        stats['Ring Dumps'] = 0
+        stats['Ring Dumps Dropped'] = 0
+        stats['Ring Triggers Suppressed'] = 0
+
+        self.ring = bytearray(self.capacity * RingBufferHandler.SLOT_SIZE)
+        self.lens = array.array('H', bytes(2 * self.capacity))
+        self.times = array.array('d', bytes(8 * self.capacity))
+        self.head = 0
+        self.count = 0
+        self.last_timestamp = None
+        self.wrap_offset = 0.0
+        window = self.pre_trigger + self.post_trigger
+        if window > 0:
+            share = int(self.capacity * self.post_trigger / window)
+        else:
+            share = 0
+        self.post_reserve = max(1, share)
+
+        self.dump_ring = bytearray(len(self.ring))
+        self.dump_lens = array.array('H', self.lens)
+        self.dump_times = array.array('d', self.times)
+        self.dump_head = 0
+        self.dump_count = 0
+        self.dump_start = 0.0
+        self.dump_seq = self.__last_dump_seq()
+        self.closing = False
+
+        self.pending_trigger = False
+        self.trigger_time = None
+        self.post_budget = 0
+        self.post_frames = 0
+        self.pre_truncated = False
+        self.holdoff_until = None
+        self.dump_ready = threading.Event()
+        self.writer_idle = threading.Event()
+        self.writer_idle.set()
+        self.thread = threading.Thread(target=self.__writer)
+        self.thread.daemon = True
+        self.thread.start()
+        logger.info(f'Ring buffer of {self.capacity} frames, dumping to '
+                    f'{self.filename} on trigger')
+
+    def __last_dump_seq(self):
+        base, ext = os.path.splitext(self.filename)
+        dirname, prefix = os.path.split(base + '-')
+        try:
+            names = os.listdir(dirname or '.')
+        except OSError:
+            return 0
+        seqs = [0]
+        for name in names:
+            seq = name[len(prefix):len(name) - len(ext)]
+            if name.startswith(prefix) and name.endswith(ext) \
+                    and seq.isdigit():
+                seqs.append(int(seq))
+        return max(seqs)
+
+    def triggerDump(self):
+        """ Request a dump. Safe to call from any thread or a signal handler;
+            the trigger time is that of the next received frame.
+        """
+        self.pending_trigger = True
+
+    def handle(self, frame):
+        pcap = frame.get_pcap()[:RingBufferHandler.SLOT_SIZE]
+        timestamp = frame.get_timestamp()
+        if self.last_timestamp is not None \
+                and timestamp < self.last_timestamp:
+            self.wrap_offset += TIMESTAMP_WRAP_USEC
+        self.last_timestamp = timestamp
+        timestamp += self.wrap_offset
+
+        off = self.head * RingBufferHandler.SLOT_SIZE
+        self.ring[off:off + len(pcap)] = pcap
+        self.lens[self.head] = len(pcap)
+        self.times[self.head] = timestamp
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+        if self.trigger_time is None:
+            if self.pending_trigger:
+                self.pending_trigger = False
+                self.__arm(timestamp)
+            elif (self.pattern is not None
+                  and self.pattern in frame.get_macPDU()):
+                if self.holdoff_until is not None \
+                        and timestamp < self.holdoff_until:
+                    stats['Ring Triggers Suppressed'] += 1
+                    return
+                self.__arm(timestamp)
+
+        if self.trigger_time is None:
+            return
+
+        self.post_frames += 1
+        window_start = self.trigger_time - self.pre_trigger
+        if timestamp - self.trigger_time >= self.post_trigger:
+            self.__dump(window_start, timestamp)
+        elif self.post_frames >= self.post_budget:
+            # The next frame would overwrite the kept pre-trigger frames
+            logger.warning('Ring buffer full before end of post-trigger '
+                           'window, dumping early. Increase -R to hold '
+                           'both windows at this frame rate')
+            self.__dump(window_start, timestamp)
+
+    def close(self):
+        """ Dumps an armed trigger with the frames received so far and waits
+            for the writer to finish. Call once capture has stopped.
+        """
+        self.writer_idle.wait()
+        if self.trigger_time is None and self.pending_trigger \
+                and self.count > 0:
+            self.pending_trigger = False
+            self.__arm(self.times[(self.head - 1) % self.capacity])
+        if self.trigger_time is not None:
+            logger.warning('Shutting down with a ring dump armed, dumping '
+                           'the post-trigger frames received so far')
+            self.__dump(self.trigger_time - self.pre_trigger,
+                        self.times[(self.head - 1) % self.capacity])
+        self.closing = True
+        self.dump_ready.set()
+        self.thread.join()
+
+    def __arm(self, timestamp):
+        """ Sizes the post-trigger budget. Ring frames are time ordered, so
+            the pre-trigger window is found by bisection.
+        """
+        self.trigger_time = timestamp
+        window_start = timestamp - self.pre_trigger
+        first = (self.head - self.count) % self.capacity
+        lo, hi = 0, self.count - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[(first + mid) % self.capacity] < window_start:
+                lo = mid + 1
+            else:
+                hi = mid
+        pre_frames = self.count - 1 - lo
+        pre_kept = min(pre_frames, self.capacity - self.post_reserve)
+        # Also truncated if the ring had already dropped part of the window
+        self.pre_truncated = pre_kept < pre_frames or (
+            self.count == self.capacity and lo == 0
+            and self.times[first] > window_start)
+        self.post_budget = self.capacity - pre_kept
+        self.post_frames = 0
+        logger.info(f'Ring buffer triggered at {timestamp:.0f}us')
+
+    def __dump(self, window_start, timestamp):
+        self.trigger_time = None
+        self.holdoff_until = timestamp + self.pre_trigger
+        if self.pre_truncated:
+            logger.warning('Ring buffer too small for the pre-trigger '
+                           'window, dump starts late. Increase -R to hold '
+                           'both windows at this frame rate')
+        if not self.writer_idle.is_set():
+            logger.warning('Previous ring dump still being written, '
+                           'dropping trigger')
+            stats['Ring Dumps Dropped'] += 1
+            return
+        self.writer_idle.clear()
+        self.dump_ring[:] = self.ring
+        self.dump_lens[:] = self.lens
+        self.dump_times[:] = self.times
+        self.dump_head = self.head
+        self.dump_count = self.count
+        self.dump_start = window_start
+        self.dump_ready.set()
+
+    def __writer(self):
+        while True:
+            self.dump_ready.wait()
+            self.dump_ready.clear()
+            if not self.writer_idle.is_set():
+                self.__write_dump()
+                self.writer_idle.set()
+            if self.closing:
+                return
+
+    def __write_dump(self):
+        base, ext = os.path.splitext(self.filename)
+        while True:
+            self.dump_seq += 1
+            filename = f'{base}-{self.dump_seq:04d}{ext}'
+            try:
+                of = open(filename, 'xb')
+                break
+            except FileExistsError:
+                continue
+            except IOError as e:
+                logger.warning(f'Error opening {filename} for ring dump')
+                logger.warning(f'The error was: {e.args}')
+                return
+        written = 0
+        try:
+            with of:
+                of.write(PCAPHelper.writeGlobalHeader())
+                first = (self.dump_head - self.dump_count) % self.capacity
+                for i in range(self.dump_count):
+                    idx = (first + i) % self.capacity
+                    if self.dump_times[idx] < self.dump_start:
+                        continue
+                    off = idx * RingBufferHandler.SLOT_SIZE
+                    of.write(self.dump_ring[off:off + self.dump_lens[idx]])
+                    written += 1
+            stats['Ring Dumps'] += 1
+            logger.info(f'RingBufferHandler: Dumped {written} frames '
+                        f'to {filename}')
+        except IOError as e:
+            logger.warning(f'Error writing ring dump to {filename}')
+            logger.warning(f'The error was: {e.args}')
+
+
 class CC2531:
 
     DEFAULT_CHANNEL = 0x0B  # 11
@@ -452,6 +715,270 @@ class CC2531:
         else:
             return "Not connected"
 
+#####################################
+# Offline analysis of pcap/hexdump captures written by this tool
+
+
+BLE_ADV_ACCESS_ADDRESS = 0x8E89BED6
+PCAP_RECORD_HDR = struct.Struct(Frame.PCAP_FRAME_HDR_FMT)
+PCAP_GLOBAL_HDR_LEN = struct.calcsize(PCAPHelper.PCAP_GLOBAL_HDR_FMT)
+# Number of consecutive well-formed record headers needed to resync a chunk
+PCAP_RESYNC_DEPTH = 8
+
+
+def pcap_timestamp(sec, usec):
+    """ Returns the record timestamp in microseconds.
+
+        Frame writes the whole timestamp minus the seconds into the usec
+        field, which is recognised by the seconds matching usec + sec.
+    """
+    if sec == (usec + sec) // 1000000:
+        return usec + sec
+    return sec * 1000000 + usec
+
+
+def timestamp_delta(later, earlier):
+    """ Interval in microseconds between two sniffer timestamps, allowing
+        for the 32-bit timestamp having wrapped in between.
+    """
+    delta = later - earlier
+    if delta < 0:
+        delta += TIMESTAMP_WRAP_USEC
+    return delta
+
+
+def device_key(pdu):
+    """ Advertiser/initiator address for advertising channel PDUs, access
+        address for data channel PDUs.
+    """
+    if len(pdu) < 4:
+        return None
+    (aa, ) = struct.unpack_from('<L', pdu)
+    if aa == BLE_ADV_ACCESS_ADDRESS and len(pdu) >= 12:
+        return ':'.join('%02x' % b for b in reversed(pdu[6:12]))
+    return 'AA 0x%08x' % aa
+
+
+def account(agg, timestamp, pdu):
+    """ Aggregate per device: [frames, first ts, last ts, intervals,
+        interval sum, interval min, interval max, length sum, length min,
+        length max]
+    """
+    key = device_key(pdu)
+    if key is None:
+        return
+    n = len(pdu)
+    a = agg.get(key)
+    if a is None:
+        agg[key] = [1, timestamp, timestamp, 0, 0.0, None, None, n, n, n]
+        return
+    interval = timestamp_delta(timestamp, a[2])
+    a[0] += 1
+    a[2] = timestamp
+    a[3] += 1
+    a[4] += interval
+    a[5] = interval if a[5] is None else min(a[5], interval)
+    a[6] = interval if a[6] is None else max(a[6], interval)
+    a[7] += n
+    a[8] = min(a[8], n)
+    a[9] = max(a[9], n)
+
+
+def merge_aggregates(into, part, link):
+    """ Merge part into into. If link is True, part continues the capture
+        of into and the interval between them is accounted for.
+    """
+    for key, b in part.items():
+        a = into.get(key)
+        if a is None:
+            into[key] = list(b)
+            continue
+        if link:
+            interval = timestamp_delta(b[1], a[2])
+            a[3] += 1
+            a[4] += interval
+            a[5] = interval if a[5] is None else min(a[5], interval)
+            a[6] = interval if a[6] is None else max(a[6], interval)
+        a[0] += b[0]
+        a[2] = b[2]
+        a[3] += b[3]
+        a[4] += b[4]
+        for i, f in ((5, min), (6, max)):
+            if b[i] is not None:
+                a[i] = b[i] if a[i] is None else f(a[i], b[i])
+        a[7] += b[7]
+        a[8] = min(a[8], b[8])
+        a[9] = max(a[9], b[9])
+
+
+def pcap_record_at(mm, pos, size):
+    """ Returns the end of the record starting at pos, or None if there is
+        no well-formed record there.
+    """
+    if pos + PCAP_RECORD_HDR.size > size:
+        return None
+    (_, _, incl_len, orig_len) = PCAP_RECORD_HDR.unpack_from(mm, pos)
+    end = pos + PCAP_RECORD_HDR.size + incl_len
+    if incl_len != orig_len or incl_len == 0 or incl_len > 0xFF \
+            or end > size:
+        return None
+    return end
+
+
+def pcap_resync(mm, pos, size, limit):
+    """ Returns the first record start in [pos, limit), or limit if there
+        is none.
+    """
+    while pos < limit:
+        end = pos
+        for _ in range(PCAP_RESYNC_DEPTH):
+            if end == size:
+                break
+            end = pcap_record_at(mm, end, size)
+            if end is None:
+                break
+        if end is not None:
+            return pos
+        pos += 1
+    return limit
+
+
+def analyze_chunk(task):
+    """ Pool worker: aggregates the records starting in [start, end) of a
+        file. Returns (file index, chunk index, frames, aggregate).
+    """
+    (file_idx, chunk_idx, path, kind, start, end) = task
+    agg = {}
+    frames = 0
+    with open(path, 'rb') as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        if kind == 'pcap':
+            pos = max(start, PCAP_GLOBAL_HDR_LEN)
+            if pos != PCAP_GLOBAL_HDR_LEN:
+                pos = pcap_resync(mm, pos, size, end)
+            while pos < end:
+                rec_end = pcap_record_at(mm, pos, size)
+                if rec_end is None:
+                    logger.warning(f'{path}: malformed record at {pos}, '
+                                   'resyncing')
+                    pos = pcap_resync(mm, pos + 1, size, end)
+                    continue
+                (sec, usec, _, _) = PCAP_RECORD_HDR.unpack_from(mm, pos)
+                account(agg, pcap_timestamp(sec, usec),
+                        mm[pos + PCAP_RECORD_HDR.size:rec_end])
+                frames += 1
+                pos = rec_end
+        else:
+            if start == 0:
+                pos = 0
+            else:
+                eol = mm.find(b'\n', start - 1)
+                pos = size if eol < 0 else eol + 1
+            while pos < end:
+                eol = mm.find(b'\n', pos)
+                if eol < 0:
+                    eol = size
+                line = mm[pos:eol].strip()
+                pos = eol + 1
+                if not line:
+                    continue
+                try:
+                    # 8 hex digits of timestamp * 32, then the frame bytes
+                    timestamp = int(line[:8], 16) / 32.0
+                    pdu = bytes.fromhex(line[8:].decode('ascii'))
+                except ValueError:
+                    logger.warning(f'{path}: malformed line before {pos}')
+                    continue
+                account(agg, timestamp, pdu)
+                frames += 1
+    return (file_idx, chunk_idx, frames, agg)
+
+
+def analysis_tasks(paths, chunk_size):
+    tasks = []
+    total = 0
+    for file_idx, path in enumerate(paths):
+        try:
+            size = os.path.getsize(path)
+            with open(path, 'rb') as f:
+                magic = f.read(4)
+        except IOError as e:
+            logger.warning(f'Error opening {path} for analysis. Skipping')
+            logger.warning(f'The error was: {e.args}')
+            continue
+        if size == 0:
+            continue
+        if magic == struct.pack('<L', PCAPHelper.MAGIC_NUMBER):
+            kind = 'pcap'
+        else:
+            kind = 'hex'
+        total += size
+        for chunk_idx, start in enumerate(range(0, size, chunk_size)):
+            tasks.append((file_idx, chunk_idx, path, kind, start,
+                          min(start + chunk_size, size)))
+    return (tasks, total)
+
+
+def analyze(paths, jobs, chunk_size):
+    """ Summarise pcap/hexdump captures per device, splitting the files in
+        chunks over a pool of jobs processes.
+    """
+    (tasks, total_bytes) = analysis_tasks(paths, chunk_size)
+    started = time.monotonic()
+    with multiprocessing.Pool(jobs) as pool:
+        parts = sorted(pool.imap_unordered(analyze_chunk, tasks),
+                       key=lambda p: (p[0], p[1]))
+    elapsed = time.monotonic() - started
+
+    # Chunks of a file are linked in order, files are separate captures
+    file_aggs = {}
+    frames = 0
+    for (file_idx, _, n, part) in parts:
+        frames += n
+        if file_idx not in file_aggs:
+            file_aggs[file_idx] = part
+        else:
+            merge_aggregates(file_aggs[file_idx], part, link=True)
+    devices = {}
+    for agg in file_aggs.values():
+        merge_aggregates(devices, agg, link=False)
+
+    s = io.StringIO()
+    s.write('%-20s %8s %12s %12s %12s %6s %6s %6s\n' %
+            ('Device', 'Frames', 'Mean int ms', 'Min int ms', 'Max int ms',
+             'Len', 'Min', 'Max'))
+    for key, a in sorted(devices.items(), key=lambda kv: -kv[1][0]):
+        if a[3]:
+            intervals = '%12.3f %12.3f %12.3f' % (a[4] / a[3] / 1000.0,
+                                                  a[5] / 1000.0,
+                                                  a[6] / 1000.0)
+        else:
+            intervals = '%12s %12s %12s' % ('-', '-', '-')
+        s.write('%-20s %8d %s %6.1f %6d %6d\n' %
+                (key, a[0], intervals, a[7] / a[0], a[8], a[9]))
+    s.write('\n%d frames, %d devices in %d files (%d chunks, %d jobs)\n' %
+            (frames, len(devices), len(file_aggs), len(tasks), jobs))
+    s.write('%.2f s, %.1f MB/s, %.0f frames/s' %
+            (elapsed, total_bytes / 1e6 / max(elapsed, 1e-9),
+             frames / max(elapsed, 1e-9)))
+    print(s.getvalue())
+
+
+def positive_int(value):
+    n = int(value)
+    if n < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive integer')
+    return n
+
+
+def non_negative_float(value):
+    n = float(value)
+    if not 0 <= n < float('inf'):
+        raise argparse.ArgumentTypeError(
+            f'{value} is not a non-negative number')
+    return n
+
 
 def arg_parser():
     debug_choices = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
@@ -512,6 +1039,53 @@ def arg_parser():
                                    omitted altogether, the capture will not \
                                    be saved.' % (defaults['pcap_file'], ))
 
+    ring_group = parser.add_argument_group('Ring Buffer Options')
+    ring_group.add_argument('-r',
+                            '--ring-file',
+                            action='store',
+                            nargs='?',
+                            const=defaults['ring_file'],
+                            default=False,
+                            help='Keep recent frames in memory and dump them \
+                                   to numbered pcap files based on RING_FILE \
+                                   when a trigger fires. If -r is specified \
+                                   but RING_FILE is omitted, %s will be used. \
+                                   Triggers: -t pattern, command t or \
+                                   SIGUSR1.' % (defaults['ring_file'], ))
+    ring_group.add_argument('-R',
+                            '--ring-frames',
+                            type=positive_int,
+                            action='store',
+                            default=defaults['ring_frames'],
+                            help='Number of frames the ring buffer holds. \
+                                   To dump both windows in full it must hold \
+                                   (pre + post seconds) x frames per second; \
+                                   otherwise both windows are shortened in \
+                                   proportion (Default: %s)' %
+                            (defaults['ring_frames'], ))
+    ring_group.add_argument('--pre-trigger',
+                            type=non_negative_float,
+                            action='store',
+                            default=defaults['pre_trigger'],
+                            help='Seconds of traffic before the trigger to \
+                                   dump (Default: %s)' %
+                            (defaults['pre_trigger'], ))
+    ring_group.add_argument('--post-trigger',
+                            type=non_negative_float,
+                            action='store',
+                            default=defaults['post_trigger'],
+                            help='Seconds of traffic after the trigger to \
+                                   dump (Default: %s)' %
+                            (defaults['post_trigger'], ))
+    ring_group.add_argument('-t',
+                            '--trigger-pattern',
+                            type=bytes.fromhex,
+                            action='store',
+                            default=None,
+                            help='Trigger a dump when a frame contains this \
+                                   hex byte pattern, e.g. an address in \
+                                   over-the-air byte order.')
+
     log_group = parser.add_argument_group('Verbosity and Logging')
     log_group.add_argument(
         '-d',
@@ -559,6 +1133,31 @@ def arg_parser():
                            action='help',
                            help='Shows this message and exits')
 
+    subparsers = parser.add_subparsers(dest='command', title='Commands')
+    analyze_parser = subparsers.add_parser(
+        'analyze',
+        description='Summarise pcap/hexdump files written by this tool \
+    per device: frame counts, intervals and frame lengths.',
+        help='Analyse saved captures offline (see analyze -h)')
+    analyze_parser.add_argument('files',
+                                nargs='+',
+                                help='pcap (-p) or hexdump (-x) files')
+    analyze_parser.add_argument('-j',
+                                '--jobs',
+                                type=positive_int,
+                                action='store',
+                                default=os.cpu_count(),
+                                help='Number of worker processes \
+                                   (Default: number of CPUs)')
+    analyze_parser.add_argument('-s',
+                                '--chunk-size',
+                                type=positive_int,
+                                action='store',
+                                default=defaults['chunk_size'],
+                                help='Split files in chunks of CHUNK_SIZE MiB \
+                                   handled by separate workers (Default: %s)' %
+                                (defaults['chunk_size'], ))
+
     return parser.parse_args()
 
 
@@ -595,6 +1194,10 @@ if __name__ == '__main__':
 
     logger.info('Started logging')
 
+    if args.command == 'analyze':
+        analyze(args.files, args.jobs, args.chunk_size * 1024 * 1024)
+        sys.exit(0)
+
     handlers = []
 
     def handlerDispatcher(timestamp, macPDU):
@@ -615,6 +1218,15 @@ if __name__ == '__main__':
         handlers.append(HexdumpHandler(args.hex_file))
     if args.pcap_file is not False:
         handlers.append(PcapDumpHandler(args.pcap_file))
+    ring = None
+    if args.ring_file is not False:
+        ring = RingBufferHandler(args.ring_file, args.ring_frames,
+                                 args.pre_trigger, args.post_trigger,
+                                 args.trigger_pattern)
+        handlers.append(ring)
+        signal.signal(signal.SIGUSR1, lambda signum, sframe: ring.triggerDump())
+        # Shut down through the exit path below so the ring gets flushed
+        signal.signal(signal.SIGTERM, lambda signum, sframe: sys.exit(0))
 
     if args.headless is False:
         h = io.StringIO()
@@ -624,6 +1236,7 @@ if __name__ == '__main__':
         h.write('h,?: Print this message\n')
         h.write('[37,39]: Change RF channel\n')
         h.write('s: Start/stop the packet capture\n')
+        h.write('t: Trigger a ring buffer dump\n')
         h.write('q: Quit')
         h = h.getvalue()
 
@@ -660,6 +1273,8 @@ if __name__ == '__main__':
                         elif cmd == 'q':
                             logger.info('User requested shutdown')
                             sys.exit(0)
+                        elif cmd == 't' and ring is not None:
+                            ring.triggerDump()
                         elif cmd == 's':
                             if snifferDev.isRunning():
                                 snifferDev.stop()
@@ -683,5 +1298,7 @@ if __name__ == '__main__':
         logger.info('Shutting down')
         if snifferDev.isRunning():
             snifferDev.stop()
+        if ring is not None:
+            ring.close()
         dump_stats()
         sys.exit(0)